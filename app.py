@@ -1,19 +1,31 @@
 # app.py - FilesFlix Main Application
-from flask import Flask, render_template, send_from_directory, request, jsonify, Response, redirect, url_for, flash
+from flask import Flask, render_template, send_file, send_from_directory, request, jsonify, Response, redirect, url_for, flash
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from werkzeug.security import safe_join
+import io
 import os
+import posixpath
+import stat
 import logging
 import json
 import mimetypes
+import time
+import threading
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 import psutil
 import socket
 
 from config import Config
-from utils import generate_thumbnail_and_hls, get_hls_path, get_thumbnail_path, check_ffmpeg, get_file_hash, get_metadata_path, extract_video_metadata
+from bandwidth import BandwidthManager, PLAYBACK, BULK
+from jobs import JobQueue
+from library import Library, walk_files
+from logconfig import setup_logging, SessionLogAggregator
+from prefetch import Prefetcher
+from pretranscode import PreTranscoder, WatchStats
+from worker import start_workers
+from zipstream import ZipEntry, ZipStream
+from utils import iter_file_range, get_hls_path, get_thumbnail_path, check_ffmpeg, get_file_hash, get_metadata_path, extract_video_metadata, is_hls_complete, count_hls_segments
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -35,57 +47,127 @@ def load_user(user_id):
     return User(user_id)
 
 # --- Globals & Setup ---
-selected_dir = os.getcwd()
-executor = ThreadPoolExecutor(max_workers=3)
-observer = None
+library = None
+job_queue = None
+watch_stats = None
+pretranscoder = None
+worker_stop = threading.Event()
+bandwidth = BandwidthManager(
+    global_limit=Config.BANDWIDTH_GLOBAL_LIMIT,
+    per_ip_limit=Config.BANDWIDTH_PER_IP_LIMIT,
+    class_limits=Config.BANDWIDTH_CLASS_LIMITS,
+    playback_reserve=Config.BANDWIDTH_PLAYBACK_RESERVE
+)
+session_log = SessionLogAggregator(Config.LOG_AGGREGATE_INTERVAL)
+prefetcher = Prefetcher(
+    segments_ahead=Config.PREFETCH_SEGMENTS,
+    buffer_bytes=Config.PREFETCH_BUFFER_BYTES,
+    stream_readahead=Config.STREAM_READAHEAD_BYTES
+)
 
 # Host credentials
 HOST_USERNAME = "admin"
 HOST_PASSWORD = "password123"
 
-def setup_logging():
-    """Setup logging configuration"""
-    logging.basicConfig(
-        level=Config.LOG_LEVEL,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(Config.LOG_DIR / 'fileflix.log'),
-            logging.StreamHandler()
-        ]
-    )
-    logging.info('FileFlix Starting Up...')
+# --- Media Library ---
+def queue_missing_thumbnails(entries):
+    """Queue thumbnail jobs for indexed videos that have no thumbnail yet"""
+    jobs = [('thumbnail', get_file_hash(entry['path']), entry['path'], entry['full_path'],
+             Config.PRIORITY_BACKGROUND)
+            for entry in entries if not get_thumbnail_path(entry['path']).exists()]
+    if jobs:
+        logging.info(f"Queuing thumbnail generation for {len(jobs)} video(s)")
+        job_queue.enqueue_many(jobs)
+
+def init_library():
+    """Index and watch every configured library root, each scanned in parallel"""
+    global library
+    library = Library(on_videos=queue_missing_thumbnails)
+    for path in Config.LIBRARY_ROOTS or [os.getcwd()]:
+        if os.path.isdir(path):
+            library.add_root(path)
+        else:
+            logging.warning(f"Skipping missing library root: {path}")
+
+# --- HLS Transcode Jobs ---
+def init_job_queue():
+    """Open the shared job queue and start any embedded worker threads"""
+    global job_queue
+    job_queue = JobQueue(Config.JOB_DB_PATH, stale_timeout=Config.JOB_STALE_TIMEOUT,
+                         retention=Config.JOB_RETENTION,
+                         shared=Config.JOB_DB_SHARED)
+    job_queue.prune()
+    if Config.EMBEDDED_WORKERS > 0:
+        start_workers(job_queue, Config.EMBEDDED_WORKERS, worker_stop)
+        logging.info(f"Started {Config.EMBEDDED_WORKERS} embedded transcode worker(s)")
+    else:
+        logging.info("No embedded transcode workers; run `python -m worker` to process jobs")
+
+def init_pretranscoding():
+    """Start idle-time pre-transcoding of the library if enabled"""
+    global watch_stats, pretranscoder
+    watch_stats = WatchStats(Config.JOB_DB_PATH, Config.WATCH_SESSION_TIMEOUT)
+    for pin in Config.PRETRANSCODE_PINS:
+        watch_stats.add_pin(pin)
+    if Config.PRETRANSCODE_ENABLED:
+        pretranscoder = PreTranscoder(library, job_queue, watch_stats)
+        pretranscoder.start()
+
+def is_video(file_path):
+    """Whether a file has a video extension HLS jobs may be queued for"""
+    return os.path.splitext(file_path)[1].lower() in Config.SUPPORTED_VIDEO_FORMATS
+
+def record_play(filepath):
+    """Count a playback start by the requesting client towards its folder's most-watched ranking"""
+    watch_stats.record_play(request.remote_addr, filepath)
+
+def get_job_state(filepath):
+    """Get the transcode state of a video, including whether playback can start"""
+    file_hash = get_file_hash(filepath)
+    state = job_queue.get(file_hash)
+    if state is None:
+        complete = is_hls_complete(filepath)
+        state = {
+            'hash': file_hash,
+            'path': filepath,
+            'status': 'done' if complete else 'idle',
+            'percent': 100.0 if complete else 0.0,
+            'segments': count_hls_segments(get_hls_path(filepath).parent) if complete else 0
+        }
+    state['ready'] = state['status'] == 'done' or (
+        state['status'] == 'running' and state['segments'] >= Config.HLS_READY_SEGMENTS)
+    return state
+
+def start_hls_job(filepath):
+    """Queue HLS generation for a video unless it is complete or already in progress"""
+    if not is_hls_complete(filepath):
+        _, file_path = library.resolve(filepath)
+        job_queue.enqueue('hls', get_file_hash(filepath), filepath, file_path,
+                          priority=Config.PRIORITY_INTERACTIVE)
+    return get_job_state(filepath)
+
+def poll_hls_job(filepath):
+    """Get the transcode state of a video a viewer is waiting on, requeueing it if its job aged out unfinished"""
+    state = get_job_state(filepath)
+    if state['status'] == 'idle':
+        state = start_hls_job(filepath)
+    return state
+
+def sse_response(events):
+    """Wrap an iterator of JSON-serializable payloads as a Server-Sent Events response"""
+    def generate():
+        for payload in events:
+            yield f"data: {json.dumps(payload)}\n\n"
 
-# --- File Watcher for Auto-Processing ---
-class MediaFileHandler(FileSystemEventHandler):
-    def process(self, event_path):
-        ext = os.path.splitext(event_path)[1].lower()
-        if ext in Config.SUPPORTED_VIDEO_FORMATS:
-            logging.info(f"Video file change detected: {event_path}. Queuing for processing.")
-            executor.submit(generate_thumbnail_and_hls, event_path, selected_dir, thumbnail_only=True)
-
-    def on_created(self, event):
-        if not event.is_directory:
-            self.process(event.src_path)
-
-    def on_modified(self, event):
-        if not event.is_directory:
-            self.process(event.src_path)
-
-def start_watcher(path):
-    """Start file system watcher"""
-    global observer
-    try:
-        if observer:
-            observer.stop()
-            observer.join()
-        
-        observer = Observer()
-        observer.schedule(MediaFileHandler(), path, recursive=True)
-        observer.start()
-        logging.info(f"Started directory watcher for: {path}")
-    except Exception as e:
-        logging.warning(f"Failed to start file watcher (this is non-critical): {e}")
-        logging.info("File watcher disabled. New files will be processed on demand.")
+    resp = Response(generate(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
+    return resp
+
+def shape(resp, route_class):
+    """Pace and count a response body under the bandwidth policy for its route class"""
+    resp.response = bandwidth.throttle(resp.response, request.remote_addr, route_class)
+    return resp
 
 def get_system_info():
     """Get system information"""
@@ -197,40 +279,27 @@ def host_dashboard():
     """Protected host dashboard"""
     system_info = get_system_info()
     return render_template('host.html', 
-                         current_dir=selected_dir, 
+                         roots=[root.info() for root in library.all_roots()], 
                          system_info=system_info)
 
 # --- API Routes ---
 @app.route('/api/files')
 def api_list_files():
-    """API endpoint to list files"""
+    """API endpoint to list files merged across library roots"""
     try:
         search_query = request.args.get('search', '').lower()
-        all_files = []
-        
-        for root, _, files in os.walk(selected_dir):
-            for name in files:
-                if search_query and search_query not in name.lower():
-                    continue
-                    
-                full_path = os.path.join(root, name)
-                rel_path = os.path.relpath(full_path, selected_dir)
-                ext = os.path.splitext(name)[1].lower()
-
-                # Pre-generate thumbnails for videos if they don't exist
-                if ext in Config.SUPPORTED_VIDEO_FORMATS and not get_thumbnail_path(rel_path).exists():
-                    executor.submit(generate_thumbnail_and_hls, full_path, selected_dir, thumbnail_only=True)
-                
-                all_files.append({
-                    'name': name,
-                    'path': rel_path,
-                    'size': os.path.getsize(full_path),
-                    'modified': os.path.getmtime(full_path)
-                })
+        root_ids = request.args.getlist('root')
+        all_files = [{
+            'name': entry['name'],
+            'path': entry['path'],
+            'root': entry['root'],
+            'size': entry['size'],
+            'modified': entry['modified']
+        } for entry in library.list_files(search_query, root_ids)]
         
         return jsonify(all_files)
     except Exception as e:
-        logging.error(f"Error listing files in {selected_dir}: {e}")
+        logging.error(f"Error listing library files: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/system')
@@ -242,7 +311,65 @@ def api_system_info():
 @app.route('/api/file/<path:filepath>')
 def api_serve_file(filepath):
     """API endpoint to serve/download files"""
-    return send_from_directory(selected_dir, filepath)
+    _, file_path = library.resolve(filepath)
+    if not file_path or not os.path.isfile(file_path):
+        return "File not found", 404
+    return shape(send_file(file_path), BULK)
+
+@app.route('/api/zip', methods=['GET', 'POST'])
+def api_download_zip():
+    """API endpoint streaming a zip of folders and/or files given as repeated `path` values"""
+    paths = request.values.getlist('path')
+    if not paths:
+        return jsonify({'error': 'At least one path is required'}), 400
+    
+    # Resolve every selection first so archive names can be made relative to their common folder
+    selections = []
+    for filepath in paths:
+        root, full_path = library.resolve(filepath.strip('/'), allow_root=True)
+        if not full_path or not os.path.exists(full_path):
+            return jsonify({'error': f'Not found: {filepath}'}), 404
+        selections.append((root, full_path, root.namespaced(os.path.relpath(full_path, root.path))))
+    
+    # Names keep the library path below the deepest folder shared by all selections, so
+    # same-named files from different folders or roots stay distinct (e.g. S1/poster.jpg)
+    base = posixpath.commonpath([posixpath.dirname(name) for _, _, name in selections])
+    
+    entries = []
+    seen = set()
+    for root, full_path, name in selections:
+        if os.path.isdir(full_path):
+            files = [(file_path, posixpath.join(name, os.path.relpath(file_path, full_path).replace(os.sep, '/')))
+                     for file_path in walk_files(full_path)]
+        else:
+            files = [(full_path, name)]
+        
+        for file_path, library_name in files:
+            if file_path in seen:
+                continue  # Selected both directly and through its folder
+            seen.add(file_path)
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue  # Dangling symlink or deleted since the walk
+            if not stat.S_ISREG(file_stat.st_mode):
+                continue  # Sockets, FIFOs and devices cannot be archived
+            arcname = posixpath.relpath(library_name, base) if base else library_name
+            entries.append(ZipEntry(arcname, file_path, file_stat.st_size, file_stat.st_mtime))
+    
+    if len(paths) == 1:
+        download_name = os.path.basename(paths[0].strip('/')) or 'filesflix'
+    else:
+        download_name = 'filesflix'
+    
+    archive = ZipStream(entries)
+    logging.info(f"Streaming zip of {len(entries)} file(s) ({len(archive)} bytes)")
+    resp = shape(Response(iter(archive), mimetype='application/zip'), BULK)
+    resp.headers['Content-Length'] = str(len(archive))
+    ascii_name = download_name.encode('ascii', 'ignore').decode().replace('"', '') or 'filesflix'
+    resp.headers['Content-Disposition'] = (f'attachment; filename="{ascii_name}.zip"; '
+                                           f"filename*=UTF-8''{quote(download_name)}.zip")
+    return resp
 
 @app.route('/api/thumbnail/<path:filepath>')
 def api_serve_thumbnail(filepath):
@@ -258,8 +385,8 @@ def api_serve_metadata(filepath):
     metadata_path = get_metadata_path(filepath)
     if not metadata_path.exists():
         # Generate metadata on the fly
-        file_path = os.path.join(selected_dir, filepath)
-        if os.path.exists(file_path):
+        _, file_path = library.resolve(filepath)
+        if file_path and os.path.exists(file_path):
             metadata = extract_video_metadata(file_path)
             if metadata:
                 metadata_path.parent.mkdir(parents=True, exist_ok=True)
@@ -276,15 +403,17 @@ def api_serve_metadata(filepath):
 @app.route('/api/stream/<path:filepath>')
 def api_stream_video(filepath):
     """API endpoint for direct video streaming with byte-range support"""
-    file_path = os.path.join(selected_dir, filepath)
+    _, file_path = library.resolve(filepath)
     
-    if not os.path.exists(file_path):
+    if not file_path or not os.path.exists(file_path):
         return "File not found", 404
         
     file_size = os.path.getsize(file_path)
     
     # Handle Range header for seeking
     range_header = request.headers.get('Range', None)
+    # Players always send Range; a plain GET is someone downloading the file
+    route_class = PLAYBACK if range_header else BULK
     if range_header:
         byte_range = range_header.replace('bytes=', '').split('-')
         start = int(byte_range[0])
@@ -292,69 +421,96 @@ def api_stream_video(filepath):
         
         if start >= file_size:
             return "Requested range not satisfiable", 416
+        if start == 0:
+            record_play(filepath)
             
-        chunk_size = min(end - start + 1, 1024 * 1024)  # 1MB chunks
-        
-        def generate():
-            with open(file_path, 'rb') as f:
-                f.seek(start)
-                remaining = end - start + 1
-                while remaining > 0:
-                    read_size = min(chunk_size, remaining)
-                    data = f.read(read_size)
-                    if not data:
-                        break
-                    remaining -= len(data)
-                    yield data
-                    
-        resp = Response(generate(), 206, mimetype=mimetypes.guess_type(file_path)[0])
+        resp = shape(Response(iter_file_range(file_path, start, end - start + 1), 206,
+                              mimetype=mimetypes.guess_type(file_path)[0]), route_class)
         resp.headers.add('Content-Range', f'bytes {start}-{end}/{file_size}')
         resp.headers.add('Accept-Ranges', 'bytes')
         resp.headers.add('Content-Length', str(end - start + 1))
+        prefetcher.stream_served(file_path, end)
         return resp
     
     # Stream the whole file
-    def generate():
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(1024 * 1024):
-                yield chunk
-                
-    return Response(generate(), mimetype=mimetypes.guess_type(file_path)[0])
+    resp = Response(iter_file_range(file_path, 0, file_size), mimetype=mimetypes.guess_type(file_path)[0])
+    return shape(resp, route_class)
 
 @app.route('/api/hls/<path:filepath>')
 def api_serve_hls_master(filepath):
     """API endpoint for HLS master playlist"""
-    file_path = os.path.join(selected_dir, filepath)
-    if not os.path.exists(file_path):
+    _, file_path = library.resolve(filepath)
+    if not file_path or not os.path.exists(file_path):
         logging.error(f"Source file not found: {filepath}")
         return "Source file not found", 404
+    if not is_video(file_path):
+        return "Not a supported video file", 400
         
     hls_path = get_hls_path(filepath)
     
-    # Generate HLS if it doesn't exist
-    if not hls_path.exists():
-        logging.info(f"HLS not found, generating for: {filepath}")
-        generate_thumbnail_and_hls(file_path, selected_dir, thumbnail_only=False)
-        
-        if not hls_path.exists():
-            logging.error(f"Failed to generate HLS for: {filepath}")
-            return "Failed to generate HLS playlist", 500
+    # Generate HLS if needed and wait only until the first segments exist
+    record_play(filepath)
+    state = start_hls_job(filepath)
+    deadline = time.time() + Config.HLS_READY_TIMEOUT
+    while not state['ready'] and state['status'] != 'failed' and time.time() < deadline:
+        time.sleep(0.5)
+        state = poll_hls_job(filepath)
+    
+    if not state['ready']:
+        logging.error(f"Failed to generate HLS for: {filepath}")
+        return "Failed to generate HLS playlist", 500
+    
+    # Redirect so relative segment URIs in the playlist resolve to the segment route
+    session_log.record(request.remote_addr, state['hash'], 'master playlist')
+    return redirect(url_for('api_serve_hls_files', videohash=state['hash'], filename=hls_path.name))
+
+@app.route('/api/progress/<path:filepath>')
+def api_transcode_progress(filepath):
+    """Server-Sent Events stream of a video's HLS transcode progress"""
+    _, file_path = library.resolve(filepath)
+    if not file_path or not os.path.exists(file_path):
+        return jsonify({'error': 'Source file not found'}), 404
+    if not is_video(file_path):
+        return jsonify({'error': 'Not a supported video file'}), 400
     
-    logging.info(f"Serving HLS master playlist: {hls_path.name}")
-    return send_from_directory(hls_path.parent, hls_path.name)
+    record_play(filepath)
+    
+    def events():
+        state = start_hls_job(filepath)
+        while True:
+            yield state
+            if state['status'] in ('done', 'failed'):
+                break
+            time.sleep(Config.PROGRESS_INTERVAL)
+            state = poll_hls_job(filepath)
+    
+    return sse_response(events())
 
 @app.route('/api/hls/<videohash>/<path:filename>')
 def api_serve_hls_files(videohash, filename):
     """API endpoint for HLS segment files"""
     hls_dir = Config.HLS_DIR / videohash
-    file_path = hls_dir / filename
+    file_path = safe_join(str(hls_dir), filename)
     
-    if not file_path.exists():
+    if not file_path or not os.path.isfile(file_path):
         logging.error(f"HLS file not found: {filename}")
         return "Not Found", 404
         
-    logging.info(f"Serving HLS file: {filename}")
-    return send_from_directory(hls_dir, filename)
+    session_log.record(request.remote_addr, videohash, 'segment' if filename.endswith('.ts') else 'file')
+    prefetcher.segment_served(request.remote_addr, videohash, filename, str(hls_dir))
+    
+    # Buffered and on-disk segments get identical validators, so Range and
+    # conditional requests behave the same whether or not the buffer was hit
+    file_stat = os.stat(file_path)
+    etag = f"{file_stat.st_mtime}-{file_stat.st_size}-{videohash}-{filename}"
+    mimetype = 'video/mp2t' if filename.endswith('.ts') else None
+    
+    # Serve from the prefetch buffer when the segment was warmed ahead of this request
+    data = prefetcher.get_buffered(file_path)
+    if data is not None and len(data) == file_stat.st_size:
+        return shape(send_file(io.BytesIO(data), mimetype=mimetype, download_name=filename,
+                               etag=etag, last_modified=file_stat.st_mtime), PLAYBACK)
+    return shape(send_file(file_path, mimetype=mimetype, etag=etag), PLAYBACK)
 
 @app.route('/api/previews/<videohash>/preview_<int:num>.jpg')
 def api_serve_preview(videohash, num):
@@ -368,12 +524,83 @@ def api_serve_preview(videohash, num):
     return send_from_directory(preview_dir, preview_file.name)
 
 # --- Host Control Routes ---
-@app.route('/api/set_directory', methods=['POST'])
+@app.route('/api/jobs')
 @login_required
-def api_set_directory():
-    """API endpoint to set media directory"""
-    global selected_dir
+def api_list_jobs():
+    """API endpoint listing HLS transcode jobs"""
+    return jsonify(job_queue.snapshot())
+
+@app.route('/api/jobs/events')
+@login_required
+def api_jobs_events():
+    """Server-Sent Events stream of all HLS transcode jobs for the host dashboard"""
+    def events():
+        while True:
+            yield job_queue.snapshot()
+            time.sleep(Config.PROGRESS_INTERVAL)
+    
+    return sse_response(events())
+
+@app.route('/api/bandwidth')
+@login_required
+def api_bandwidth():
+    """API endpoint with per-client throughput counters"""
+    return jsonify(bandwidth.snapshot())
+
+@app.route('/api/bandwidth/events')
+@login_required
+def api_bandwidth_events():
+    """Server-Sent Events stream of per-client throughput for the host dashboard"""
+    def events():
+        while True:
+            yield bandwidth.snapshot()
+            time.sleep(Config.PROGRESS_INTERVAL)
     
+    return sse_response(events())
+
+@app.route('/api/sessions')
+@login_required
+def api_playback_sessions():
+    """API endpoint listing the HLS playback sessions the prefetcher is tracking"""
+    return jsonify(prefetcher.active_sessions())
+
+@app.route('/api/pretranscode')
+@login_required
+def api_pretranscode_status():
+    """API endpoint with the idle-time pre-transcoding status"""
+    if pretranscoder is None:
+        return jsonify({'enabled': False, 'pins': watch_stats.pins()})
+    return jsonify(pretranscoder.status())
+
+@app.route('/api/pretranscode/pins', methods=['POST', 'DELETE'])
+@login_required
+def api_pretranscode_pins():
+    """API endpoint to pin or unpin a library path or folder for pre-transcoding"""
+    data = request.get_json()
+    if not data or not data.get('path'):
+        return jsonify({'error': 'Path required'}), 400
+    
+    if request.method == 'POST':
+        _, full_path = library.resolve(data['path'].strip('/'))
+        if not full_path or not os.path.exists(full_path):
+            return jsonify({'error': 'Path not found in library'}), 404
+        watch_stats.add_pin(data['path'])
+    elif not watch_stats.remove_pin(data['path']):
+        return jsonify({'error': 'Path is not pinned'}), 404
+    
+    logging.info(f"Pre-transcode pins updated by user {current_user.id}")
+    return jsonify({'status': 'success', 'pins': watch_stats.pins()})
+
+@app.route('/api/roots', methods=['GET'])
+def api_list_roots():
+    """API endpoint listing library roots for per-root filtering"""
+    return jsonify([{k: info[k] for k in ('id', 'name', 'files', 'scanning')}
+                    for info in (root.info() for root in library.all_roots())])
+
+@app.route('/api/roots', methods=['POST'])
+@login_required
+def api_add_root():
+    """API endpoint to add a library root; it is indexed and watched alongside the others"""
     data = request.get_json()
     if not data or 'directory' not in data:
         return jsonify({'error': 'Directory path required'}), 400
@@ -381,14 +608,38 @@ def api_set_directory():
     new_dir = data['directory']
     
     if new_dir and os.path.isdir(new_dir):
-        selected_dir = os.path.abspath(new_dir)
-        logging.info(f"Directory changed to: {selected_dir} by user {current_user.id}")
-        start_watcher(selected_dir)
-        return jsonify({'status': 'success', 'directory': selected_dir})
+        root = library.add_root(new_dir)
+        logging.info(f"Library root {root.id} added: {root.path} by user {current_user.id}")
+        return jsonify({'status': 'success', 'root': root.info(), 'directory': root.path})
     
     logging.warning(f"Invalid directory requested: {new_dir}")
     return jsonify({'error': 'Invalid directory path'}), 400
 
+@app.route('/api/roots/<root_id>', methods=['DELETE'])
+@login_required
+def api_remove_root(root_id):
+    """API endpoint to remove a library root"""
+    if not library.remove_root(root_id):
+        return jsonify({'error': 'Unknown library root'}), 404
+    logging.info(f"Library root {root_id} removed by user {current_user.id}")
+    return jsonify({'status': 'success'})
+
+@app.route('/api/roots/<root_id>/scan', methods=['POST'])
+@login_required
+def api_scan_root(root_id):
+    """API endpoint to rescan a single library root"""
+    root = library.get_root(root_id)
+    if not root:
+        return jsonify({'error': 'Unknown library root'}), 404
+    started = root.scan_async()
+    return jsonify({'status': 'scanning' if started else 'already scanning', 'root': root.info()})
+
+@app.route('/api/set_directory', methods=['POST'])
+@login_required
+def api_set_directory():
+    """Legacy endpoint to set media directory; now adds it as a library root"""
+    return api_add_root()
+
 # --- Error Handlers ---
 @app.errorhandler(404)
 def not_found_error(error):
@@ -403,13 +654,20 @@ if __name__ == '__main__':
     # Initialize app
     Config.init_app(app)
     setup_logging()
+    logging.info('FileFlix Starting Up...')
     
     # Check for FFmpeg
     if not check_ffmpeg():
         logging.warning("FFmpeg not found. Video processing will be limited!")
     
-    # Start file watcher
-    start_watcher(selected_dir)
+    # Open the transcode job queue
+    init_job_queue()
+    
+    # Index and watch the library roots
+    init_library()
+    
+    # Pre-transcode the library while the server is idle
+    init_pretranscoding()
     
     # Run the app
     logging.info(f"Starting FilesFlix server on http://{Config.HOST}:{Config.PORT}")
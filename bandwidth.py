@@ -0,0 +1,231 @@
+# bandwidth.py - Per-client bandwidth shaping and throughput counters
+import threading
+import time
+
+PLAYBACK = 'playback'
+BULK = 'bulk'
+
+
+class TokenBucket:
+    """
+    Token bucket that lets callers go into debt: consume() always succeeds and
+    returns how long the caller should sleep to stay within the rate. Concurrent
+    consumers therefore queue up fairly instead of racing for refills.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._burst_follows_rate = burst is None
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        if rate == self.rate:
+            return
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            if self._burst_follows_rate:
+                self.burst = rate
+                self.tokens = min(self.tokens, self.burst)
+
+    def consume(self, amount):
+        """Takes amount tokens; returns seconds to wait (0 when unlimited or within budget)."""
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+
+class ClientStats:
+    """Throughput counters for one client IP."""
+
+    def __init__(self):
+        self.bytes = {PLAYBACK: 0, BULK: 0}
+        self.rate = {PLAYBACK: 0.0, BULK: 0.0}  # Smoothed bytes per second
+        self.active = 0
+        self.active_bulk = 0
+        self.last_seen = time.time()
+        self._window_start = time.monotonic()
+        self._window_bytes = {PLAYBACK: 0, BULK: 0}
+
+    def record(self, route_class, amount, smoothing=0.5, window=1.0):
+        self.bytes[route_class] += amount
+        self._window_bytes[route_class] += amount
+        self.last_seen = time.time()
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= window:
+            self._roll(elapsed, smoothing)
+            self._window_start = now
+
+    def _roll(self, elapsed, smoothing):
+        for route_class, amount in self._window_bytes.items():
+            current = amount / elapsed
+            self.rate[route_class] = smoothing * current + (1 - smoothing) * self.rate[route_class]
+            self._window_bytes[route_class] = 0
+
+
+class BandwidthManager:
+    """
+    Shapes response bodies with token buckets:
+      - a global cap shared by all traffic,
+      - a fair share of the global cap for each client IP with an open response,
+        so a client cannot take more by opening more connections,
+      - an optional static per-IP cap across route classes,
+      - per-IP caps for each route class (playback segments vs. bulk downloads).
+    While anyone is watching, bulk traffic may only use the part of the global
+    cap not reserved for playback, so downloads cannot starve HLS viewers; that
+    bulk budget is likewise split evenly between the clients downloading.
+    """
+
+    def __init__(self, global_limit=0, per_ip_limit=0, class_limits=None,
+                 playback_reserve=0.5, playback_idle=10, chunk_size=64 * 1024,
+                 client_idle=300, prune_interval=30):
+        self.global_limit = global_limit
+        self.per_ip_limit = per_ip_limit
+        self.class_limits = class_limits or {}
+        self.playback_reserve = playback_reserve
+        self.playback_idle = playback_idle
+        self.chunk_size = chunk_size
+        self.client_idle = client_idle          # Seconds before an idle client's counters are dropped
+        self.prune_interval = prune_interval
+        self.global_bucket = TokenBucket(global_limit)
+        self.bulk_bucket = TokenBucket(global_limit)
+        self._fair_buckets = {}
+        self._bulk_fair_buckets = {}
+        self._ip_buckets = {}
+        self._class_buckets = {}
+        self._stats = {}
+        self._active_clients = 0
+        self._active_bulk_clients = 0
+        self._last_playback = 0
+        self._last_prune = time.monotonic()
+        self._lock = threading.Lock()
+
+    def throttle(self, iterable, client_ip, route_class):
+        """Wraps a response body iterable, pacing and counting the bytes sent to a client."""
+        with self._lock:
+            stats = self._stats.setdefault(client_ip, ClientStats())
+            stats.last_seen = time.time()
+            self._connection_opened(stats, route_class)
+        buckets = self._buckets_for(client_ip, route_class)
+        limited = any(bucket.rate > 0 for bucket in buckets)
+        try:
+            for chunk in iterable:
+                # Pace in small slices so large reads don't turn into long bursts and stalls
+                pieces = ([chunk[i:i + self.chunk_size] for i in range(0, len(chunk), self.chunk_size)]
+                          if limited and len(chunk) > self.chunk_size else [chunk])
+                for piece in pieces:
+                    self._pace(client_ip, buckets, route_class, len(piece))
+                    with self._lock:
+                        stats.record(route_class, len(piece))
+                    yield piece
+        finally:
+            with self._lock:
+                self._connection_closed(stats, route_class)
+            self._maybe_prune()
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    def _connection_opened(self, stats, route_class):
+        if stats.active == 0:
+            self._active_clients += 1
+        stats.active += 1
+        if route_class == BULK:
+            if stats.active_bulk == 0:
+                self._active_bulk_clients += 1
+            stats.active_bulk += 1
+
+    def _connection_closed(self, stats, route_class):
+        stats.active -= 1
+        if stats.active == 0:
+            self._active_clients -= 1
+        if route_class == BULK:
+            stats.active_bulk -= 1
+            if stats.active_bulk == 0:
+                self._active_bulk_clients -= 1
+
+    def _pace(self, client_ip, buckets, route_class, amount):
+        bulk_limit = self.global_limit
+        if route_class == PLAYBACK:
+            self._last_playback = time.monotonic()
+        else:
+            # Bulk traffic gets the unreserved share of the global cap while playback is active
+            watching = time.monotonic() - self._last_playback < self.playback_idle
+            bulk_limit = self.global_limit * ((1 - self.playback_reserve) if watching else 1)
+            self.bulk_bucket.set_rate(bulk_limit)
+        if self.global_limit > 0:
+            # Split the budgets evenly between the clients currently receiving data
+            self._fair_buckets[client_ip].set_rate(self.global_limit / max(1, self._active_clients))
+            if route_class == BULK:
+                self._bulk_fair_buckets[client_ip].set_rate(bulk_limit / max(1, self._active_bulk_clients))
+        wait = max(bucket.consume(amount) for bucket in buckets)
+        if wait > 0:
+            time.sleep(wait)
+
+    def _buckets_for(self, client_ip, route_class):
+        with self._lock:
+            buckets = [self.global_bucket]
+            if self.global_limit > 0:
+                buckets.append(self._fair_buckets.setdefault(client_ip, TokenBucket(self.global_limit)))
+            if route_class == BULK:
+                buckets.append(self.bulk_bucket)
+                if self.global_limit > 0:
+                    buckets.append(self._bulk_fair_buckets.setdefault(client_ip, TokenBucket(self.global_limit)))
+            if self.per_ip_limit > 0:
+                buckets.append(self._ip_buckets.setdefault(client_ip, TokenBucket(self.per_ip_limit)))
+            class_limit = self.class_limits.get(route_class, 0)
+            if class_limit > 0:
+                key = (client_ip, route_class)
+                buckets.append(self._class_buckets.setdefault(key, TokenBucket(class_limit)))
+            return buckets
+
+    def _maybe_prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
+        with self._lock:
+            self._prune(time.time(), self.client_idle)
+
+    def _prune(self, now, idle_timeout):
+        """Drops counters and buckets of clients with no open response that were idle for idle_timeout."""
+        for client_ip, stats in list(self._stats.items()):
+            if stats.active == 0 and now - stats.last_seen > idle_timeout:
+                del self._stats[client_ip]
+                for buckets in (self._fair_buckets, self._bulk_fair_buckets, self._ip_buckets):
+                    buckets.pop(client_ip, None)
+                for key in [k for k in self._class_buckets if k[0] == client_ip]:
+                    del self._class_buckets[key]
+
+    def snapshot(self, idle_timeout=None):
+        """Returns per-client counters, dropping clients idle for longer than idle_timeout."""
+        now = time.time()
+        clients = []
+        with self._lock:
+            self._prune(now, self.client_idle if idle_timeout is None else idle_timeout)
+            for client_ip, stats in self._stats.items():
+                # Decay rates of clients that stopped receiving data
+                if now - stats.last_seen > 2:
+                    stats.rate = {route_class: 0.0 for route_class in stats.rate}
+                clients.append({
+                    'ip': client_ip,
+                    'active': stats.active,
+                    'playback_rate': round(stats.rate[PLAYBACK]),
+                    'bulk_rate': round(stats.rate[BULK]),
+                    'playback_bytes': stats.bytes[PLAYBACK],
+                    'bulk_bytes': stats.bytes[BULK],
+                    'last_seen': stats.last_seen
+                })
+        return sorted(clients, key=lambda c: c['playback_rate'] + c['bulk_rate'], reverse=True)
@@ -10,9 +10,16 @@ class Config:
     HLS_DIR = CACHE_DIR / 'hls'
     METADATA_DIR = CACHE_DIR / 'metadata'  # New directory for storing track metadata
     
+    # Media directories served as one merged library; empty means the working directory
+    LIBRARY_ROOTS = []
+    
     HOST = '0.0.0.0'
     PORT = 5000
     LOG_LEVEL = logging.INFO
+    LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate the log file at this size
+    LOG_BACKUP_COUNT = 5              # Rotated log files kept
+    LOG_QUEUE_SIZE = 10000            # Records buffered for the background writer before dropping
+    LOG_AGGREGATE_INTERVAL = 60       # Seconds between per-session playback summaries
     
     SUPPORTED_VIDEO_FORMATS = {'.mp4', '.mkv', '.mov', '.avi', '.wmv', '.flv', '.webm', '.m4v'}
     SUPPORTED_IMAGE_FORMATS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
@@ -21,6 +28,46 @@ class Config:
     THUMBNAIL_SIZE = (480, -1)  # Increased size for better quality
     THUMBNAIL_QUALITY = 3      # 1-31, lower is higher quality
     
+    HLS_TIMEOUT = 1800         # Seconds before an HLS encode is abandoned
+    HLS_READY_SEGMENTS = 3     # Segments needed before playback may start
+    HLS_READY_TIMEOUT = 60     # Seconds the playlist route waits for the first segments
+    HLS_AUDIO_BITRATE = 128000 # Bits per second of each AAC audio rendition
+    PROGRESS_INTERVAL = 1.0    # Seconds between Server-Sent Event progress updates
+    
+    # Bandwidth shaping in bytes per second (0 = unlimited). Set the global cap a
+    # little below the uplink so playback can be prioritised over bulk downloads.
+    BANDWIDTH_GLOBAL_LIMIT = 0
+    BANDWIDTH_PER_IP_LIMIT = 0
+    BANDWIDTH_CLASS_LIMITS = {'playback': 0, 'bulk': 0}  # Per-IP caps for each route class
+    BANDWIDTH_PLAYBACK_RESERVE = 0.5  # Share of the global cap bulk traffic leaves free while anyone is watching
+    
+    # Read-ahead for active playback sessions
+    PREFETCH_SEGMENTS = 3                      # Upcoming HLS segments warmed per viewer
+    PREFETCH_BUFFER_BYTES = 64 * 1024 * 1024   # In-memory segment buffer; 0 relies on OS hints only
+    STREAM_READAHEAD_BYTES = 8 * 1024 * 1024   # Read-ahead hint past each ranged direct-stream response
+    
+    # Transcode job queue (shared with standalone `python -m worker` processes)
+    JOB_DB_PATH = CACHE_DIR / 'jobs.sqlite3'
+    JOB_DB_SHARED = False      # True when workers on other machines use the queue over a network filesystem
+    EMBEDDED_WORKERS = 1       # Worker threads inside the web process; 0 when running standalone workers
+    WORKER_POLL_INTERVAL = 2   # Seconds an idle worker waits before polling the queue again
+    WORKER_HEARTBEAT_INTERVAL = 15
+    JOB_STALE_TIMEOUT = 120    # Seconds without a heartbeat before a job is handed to another worker
+    JOB_RETENTION = 600        # Seconds finished jobs stay visible on the dashboard
+    PRIORITY_INTERACTIVE = 10  # Jobs a viewer is waiting on
+    PRIORITY_BACKGROUND = 0    # Thumbnails discovered while scanning
+    PRIORITY_PRETRANSCODE = -10  # Idle-time pre-transcoding; yields to interactive jobs
+    
+    # Idle-time pre-transcoding of the library
+    PRETRANSCODE_ENABLED = False
+    PRETRANSCODE_INTERVAL = 30          # Seconds between idle checks
+    PRETRANSCODE_CPU_THRESHOLD = 20     # CPU percent below which the server counts as idle
+    PRETRANSCODE_WINDOW = None          # Local hours always treated as idle, e.g. (1, 6); may wrap midnight
+    PRETRANSCODE_POLICIES = ['pinned', 'most_watched', 'newest']  # Ordering, highest precedence first
+    PRETRANSCODE_PINS = []              # Library paths or folders to transcode first, e.g. 'movies/Favourites'
+    WATCH_SESSION_TIMEOUT = 1800        # Seconds a viewer's repeated requests for a video count as one play
+    CACHE_SIZE_BUDGET = 0               # Bytes of HLS cache pre-transcoding may fill; 0 = unlimited
+    
     @classmethod
     def init_app(cls, app):
         cls.LOG_DIR.mkdir(exist_ok=True)
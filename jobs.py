@@ -0,0 +1,224 @@
+# jobs.py - Durable transcode job queue
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    path TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    updated REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active ON jobs (kind, file_hash)
+    WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, id);
+CREATE INDEX IF NOT EXISTS jobs_lookup ON jobs (kind, file_hash, id DESC);
+"""
+
+def default_worker_id():
+    """Identifies a worker thread across processes and machines sharing the queue."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of transcode jobs shared by the web process and workers.
+    The web process only enqueues and reads status; workers claim jobs, report
+    progress (which doubles as a heartbeat) and mark them finished.
+    """
+
+    def __init__(self, db_path, stale_timeout=120, max_attempts=3, retention=600, shared=False):
+        self.db_path = str(db_path)
+        # WAL needs shared memory on a single host; a queue on a network filesystem
+        # used by several machines must fall back to a rollback journal
+        self.journal_mode = 'DELETE' if shared else 'WAL'
+        self.stale_timeout = stale_timeout  # Seconds without a heartbeat before a running job is requeued
+        self.max_attempts = max_attempts
+        self.retention = retention          # Seconds to keep finished jobs visible
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            conn.execute("PRAGMA synchronous=NORMAL" if self.journal_mode == 'WAL' else "PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    # --- Producer side ---
+    def enqueue(self, kind, file_hash, path, video_path, priority=0):
+        """Queues a job unless an identical one is already queued or running."""
+        self.enqueue_many([(kind, file_hash, path, video_path, priority)])
+
+    def enqueue_many(self, jobs):
+        """Queues several (kind, file_hash, path, video_path, priority) jobs in one transaction."""
+        now = time.time()
+        with self._transaction() as conn:
+            for kind, file_hash, path, video_path, priority in jobs:
+                conn.execute(
+                    "INSERT OR IGNORE INTO jobs (kind, file_hash, path, video_path, priority, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, file_hash, path, video_path, priority, now, now))
+                # An interactive request may raise the priority of an already queued or running job
+                conn.execute(
+                    "UPDATE jobs SET priority = ? WHERE kind = ? AND file_hash = ? "
+                    "AND status IN ('queued', 'running') AND priority < ?",
+                    (priority, kind, file_hash, priority))
+
+    def get(self, file_hash, kind='hls'):
+        """Returns the most recent job for a file as a state dict, or None if unknown."""
+        row = self._connection().execute(
+            "SELECT * FROM jobs WHERE kind = ? AND file_hash = ? ORDER BY id DESC LIMIT 1",
+            (kind, file_hash)).fetchone()
+        return self._to_state(row) if row else None
+
+    def snapshot(self, kind='hls'):
+        """Returns active and recently finished jobs, most recently created first."""
+        cutoff = time.time() - self.retention
+        rows = self._connection().execute(
+            "SELECT * FROM jobs WHERE kind = ? AND (status IN ('queued', 'running') OR updated >= ?) "
+            "ORDER BY id DESC", (kind, cutoff)).fetchall()
+        return [self._to_state(row) for row in rows]
+
+    # --- Worker side ---
+    def claim(self, worker_id, min_priority=None):
+        """Atomically takes the highest-priority queued job (optionally only from min_priority). Returns it as a dict, or None."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND (? IS NULL OR priority >= ?) "
+                "ORDER BY priority DESC, id LIMIT 1", (min_priority, min_priority)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, started = ?, updated = ? "
+                "WHERE id = ?", (worker_id, now, now, row['id']))
+        job = dict(row)
+        job['attempts'] += 1
+        return job
+
+    def update_progress(self, job_id, state):
+        """Stores a progress state for a running job and refreshes its heartbeat."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            progress = json.loads(row['progress'])
+            progress.update({k: v for k, v in state.items() if k not in ('status', 'error')})
+            conn.execute("UPDATE jobs SET progress = ?, updated = ? WHERE id = ? AND status = 'running'",
+                         (json.dumps(progress), time.time(), job_id))
+
+    def heartbeat(self, job_id):
+        """Marks a running job as still alive without changing its progress."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+
+    def has_active(self, min_priority, kind='hls'):
+        """True if any queued or running job has at least the given priority."""
+        row = self._connection().execute(
+            "SELECT 1 FROM jobs WHERE kind = ? AND status IN ('queued', 'running') AND priority >= ? LIMIT 1",
+            (kind, min_priority)).fetchone()
+        return row is not None
+
+    def should_yield(self, job_id, min_priority):
+        """
+        True if another queued or running job of at least min_priority outranks this
+        running job, whichever worker or process it belongs to.
+        """
+        row = self._connection().execute(
+            "SELECT 1 FROM jobs AS other, jobs AS own WHERE own.id = ? AND other.id != own.id "
+            "AND other.status IN ('queued', 'running') AND other.priority >= ? "
+            "AND other.priority > own.priority LIMIT 1",
+            (job_id, min_priority)).fetchone()
+        return row is not None
+
+    def complete(self, job_id):
+        self._finish(job_id, 'done', None)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, 'failed', error)
+
+    def _finish(self, job_id, status, error):
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                         (status, error, time.time(), job_id))
+
+    def recover_stale(self):
+        """Requeues running jobs whose worker stopped heartbeating; fails them after max_attempts."""
+        now = time.time()
+        cutoff = now - self.stale_timeout
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', updated = ? "
+                "WHERE status = 'running' AND updated < ? AND attempts >= ?",
+                (now, cutoff, self.max_attempts))
+            recovered = conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, progress = '{}', updated = ? "
+                "WHERE status = 'running' AND updated < ?", (now, cutoff)).rowcount
+        return recovered
+
+    def prune(self):
+        """Deletes finished jobs older than the retention period."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+                         (time.time() - self.retention,))
+
+    @staticmethod
+    def _to_state(row):
+        progress = json.loads(row['progress'])
+        state = {
+            'id': row['id'],
+            'hash': row['file_hash'],
+            'path': row['path'],
+            'status': row['status'],
+            'priority': row['priority'],
+            'worker': row['worker'],
+            'error': row['error'],
+            'percent': 0.0,
+            'fps': 0.0,
+            'speed': 0.0,
+            'eta': None,
+            'segments': 0,
+            'started': row['started'],
+            'updated': row['updated']
+        }
+        state.update(progress)
+        if row['status'] == 'done':
+            state.update(percent=100.0, eta=0)
+        return state
+
+
+class _Transaction:
+    """Runs a block inside BEGIN IMMEDIATE ... COMMIT on an autocommit connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,271 @@
+# library.py - Media library roots, indexing and watching
+import hashlib
+import os
+import re
+import logging
+import threading
+import time
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from config import Config
+
+
+def walk_files(top):
+    """
+    Yields the path of every file below a directory. Symlinked files and folders
+    are part of the library; folders are only entered once per real path so link
+    loops terminate.
+    """
+    visited = set()
+    for dirpath, dirnames, names in os.walk(top, followlinks=True):
+        real_dir = os.path.realpath(dirpath)
+        if real_dir in visited:
+            dirnames[:] = []
+            continue
+        visited.add(real_dir)
+        dirnames.sort()
+        for name in sorted(names):
+            yield os.path.join(dirpath, name)
+
+
+class LibraryRoot:
+    """
+    One configured media directory with its own in-memory file index,
+    file system watcher and scan thread. Paths exposed to clients are
+    namespaced as "<root id>/<path relative to the root>".
+    """
+
+    def __init__(self, root_id, path, on_videos=None):
+        self.id = root_id
+        # Resolved once so roots mounted through a symlink compare and serve consistently
+        self.path = os.path.realpath(path)
+        self.name = os.path.basename(self.path.rstrip(os.sep)) or self.path
+        self.on_videos = on_videos  # Called with lists of new or changed video entries
+        self.files = {}
+        self.scanning = False
+        self.last_scan = None
+        self._lock = threading.Lock()
+        self._observer = None
+
+    def namespaced(self, rel_path):
+        if rel_path in ('', '.'):
+            return self.id
+        return f"{self.id}/{rel_path.replace(os.sep, '/')}"
+
+    def resolve(self, rel_path):
+        """
+        Returns the absolute path of a file under this root, or None if it escapes the root.
+        The check is lexical: ".." and absolute paths are rejected, but symlinks placed
+        inside the root are followed, matching what the scan lists.
+        """
+        full_path = os.path.normpath(os.path.join(self.path, rel_path))
+        if full_path != self.path and os.path.commonpath([self.path, full_path]) != self.path:
+            return None
+        return full_path
+
+    # --- Indexing ---
+    def scan_async(self):
+        """Rescans the root on its own thread unless a scan is already running."""
+        with self._lock:
+            if self.scanning:
+                return False
+            self.scanning = True
+        threading.Thread(target=self._scan, name=f"scan-{self.id}", daemon=True).start()
+        return True
+
+    def _scan(self):
+        start_time = time.time()
+        files = {}
+        try:
+            for full_path in walk_files(self.path):
+                entry = self._make_entry(full_path)
+                if entry:
+                    files[entry['path']] = entry
+            with self._lock:
+                self.files = files
+                self.last_scan = time.time()
+            logging.info(f"Scanned library root {self.id} ({self.path}): "
+                         f"{len(files)} files in {time.time() - start_time:.1f}s")
+            self._notify([entry for entry in files.values() if entry['video']])
+        except Exception as e:
+            logging.error(f"Error scanning library root {self.path}: {e}")
+        finally:
+            with self._lock:
+                self.scanning = False
+
+    def _make_entry(self, full_path):
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+        name = os.path.basename(full_path)
+        rel_path = os.path.relpath(full_path, self.path)
+        return {
+            'name': name,
+            'path': self.namespaced(rel_path),
+            'root': self.id,
+            'size': stat.st_size,
+            'modified': stat.st_mtime,
+            'video': os.path.splitext(name)[1].lower() in Config.SUPPORTED_VIDEO_FORMATS,
+            'full_path': full_path
+        }
+
+    def update_file(self, full_path):
+        entry = self._make_entry(full_path)
+        if entry is None:
+            return
+        with self._lock:
+            self.files[entry['path']] = entry
+        if entry['video']:
+            self._notify([entry])
+
+    def remove_path(self, full_path):
+        """Drops a file, or every file below a directory, from the index."""
+        key = self.namespaced(os.path.relpath(full_path, self.path))
+        with self._lock:
+            self.files.pop(key, None)
+            prefix = key + '/'
+            for path in [p for p in self.files if p.startswith(prefix)]:
+                del self.files[path]
+
+    def entries(self):
+        with self._lock:
+            return list(self.files.values())
+
+    def _notify(self, entries):
+        if self.on_videos and entries:
+            try:
+                self.on_videos(entries)
+            except Exception as e:
+                logging.warning(f"Library callback failed for root {self.id}: {e}")
+
+    # --- Watching ---
+    def start_watcher(self):
+        """Start file system watcher"""
+        self.stop_watcher()
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_RootEventHandler(self), self.path, recursive=True)
+            self._observer.start()
+            logging.info(f"Started directory watcher for: {self.path}")
+        except Exception as e:
+            self._observer = None
+            logging.warning(f"Failed to start file watcher for {self.path} (this is non-critical): {e}")
+            logging.info("File watcher disabled. Rescan the root to pick up new files.")
+
+    def stop_watcher(self):
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def info(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'name': self.name,
+                'path': self.path,
+                'files': len(self.files),
+                'scanning': self.scanning,
+                'last_scan': self.last_scan,
+                'watching': self._observer is not None
+            }
+
+
+class _RootEventHandler(FileSystemEventHandler):
+    def __init__(self, root):
+        self.root = root
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.root.update_file(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.root.update_file(event.src_path)
+
+    def on_deleted(self, event):
+        self.root.remove_path(event.src_path)
+
+    def on_moved(self, event):
+        self.root.remove_path(event.src_path)
+        if event.is_directory:
+            self.root.scan_async()
+        else:
+            self.root.update_file(event.dest_path)
+
+
+class Library:
+    """The set of configured library roots, with listings merged across them."""
+
+    def __init__(self, on_videos=None):
+        self.on_videos = on_videos
+        self.roots = {}
+        self._lock = threading.Lock()
+
+    def add_root(self, path):
+        """Adds, indexes and watches a directory. Returns the existing root if already added."""
+        path = os.path.realpath(path)
+        with self._lock:
+            for root in self.roots.values():
+                if root.path == path:
+                    return root
+            root = LibraryRoot(self._make_id(path), path, self.on_videos)
+            self.roots[root.id] = root
+        root.start_watcher()
+        root.scan_async()
+        logging.info(f"Added library root {root.id}: {path}")
+        return root
+
+    def remove_root(self, root_id):
+        with self._lock:
+            root = self.roots.pop(root_id, None)
+        if root:
+            root.stop_watcher()
+            logging.info(f"Removed library root {root_id}: {root.path}")
+        return root
+
+    def get_root(self, root_id):
+        with self._lock:
+            return self.roots.get(root_id)
+
+    def all_roots(self):
+        with self._lock:
+            return list(self.roots.values())
+
+    def resolve(self, filepath, allow_root=False):
+        """
+        Maps a namespaced path to (root, absolute path); returns (None, None) if unknown or unsafe.
+        A bare root ID only resolves to the root directory itself when allow_root is set.
+        """
+        root_id, _, rel_path = filepath.partition('/')
+        root = self.get_root(root_id)
+        if root is None or not (rel_path or allow_root):
+            return None, None
+        full_path = root.resolve(rel_path)
+        if full_path is None:
+            return None, None
+        return root, full_path
+
+    def list_files(self, search_query='', root_ids=None):
+        """Lists indexed files across roots, optionally filtered by name and by root."""
+        files = []
+        for root in self.all_roots():
+            if root_ids and root.id not in root_ids:
+                continue
+            for entry in root.entries():
+                if search_query and search_query not in entry['name'].lower():
+                    continue
+                files.append(entry)
+        return files
+
+    def _make_id(self, path):
+        # IDs also namespace the thumbnail/HLS cache, so they must depend only on the
+        # directory itself, never on the order roots were added in
+        base = re.sub(r'[^a-z0-9]+', '-', os.path.basename(path.rstrip(os.sep)).lower()).strip('-') or 'root'
+        digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+        length = 6
+        while f"{base}-{digest[:length]}" in self.roots:
+            length += 2  # Prefix collision with another path; a longer digest is still stable
+        return f"{base}-{digest[:length]}"
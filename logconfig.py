@@ -0,0 +1,126 @@
+# logconfig.py - Non-blocking logging setup and hot-path log aggregation
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from config import Config
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking or erroring when the queue
+    is full. Once there is room again, a warning with the number dropped is logged.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def enqueue(self, record):
+        try:
+            if self._unreported:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': 'logconfig', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f"Log queue full; dropped {self._unreported} record(s) ({self.dropped} in total)"}))
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+
+class HlsAccessFilter(logging.Filter):
+    """
+    Drops the development server's access lines for successful HLS file requests,
+    one per segment per viewer; SessionLogAggregator summarises those instead.
+    """
+
+    def filter(self, record):
+        args = record.args
+        if isinstance(args, tuple) and len(args) == 3:
+            request_line, code = str(args[0]), str(args[1])
+            if ' /api/hls/' in request_line and code[:1] in ('2', '3'):
+                return False
+        return True
+
+
+def setup_logging(log_name='fileflix.log', fmt=LOG_FORMAT):
+    """
+    Routes all logging through a bounded in-memory queue drained by a background
+    listener, so request threads never wait on disk. The listener writes to a
+    size-rotated log file and the console.
+    """
+    formatter = logging.Formatter(fmt)
+    file_handler = RotatingFileHandler(Config.LOG_DIR / log_name, maxBytes=Config.LOG_MAX_BYTES,
+                                       backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8')
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(Config.LOG_LEVEL)
+
+    logging.getLogger('werkzeug').addFilter(HlsAccessFilter())
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class SessionLogAggregator:
+    """
+    Replaces per-request log lines on hot paths with one line when a viewer
+    session starts and a periodic summary of what each session fetched.
+    Recording an event is just a counter increment under a lock.
+    """
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, client, video, event):
+        key = (client, video)
+        with self._lock:
+            counts = self._counts.get(key)
+            is_new = counts is None
+            if is_new:
+                counts = self._counts[key] = {}
+            counts[event] = counts.get(event, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-aggregator', daemon=True)
+                self._thread.start()
+        if is_new:
+            logging.info(f"Playback session started: client {client}, video {video}")
+
+    def flush(self):
+        """Logs and resets the counters of every session active since the last flush."""
+        with self._lock:
+            active = {key: counts for key, counts in self._counts.items() if counts}
+            for key in list(self._counts):
+                if key in active:
+                    self._counts[key] = {}
+                else:
+                    del self._counts[key]  # Idle for a whole interval; the next event starts a new session
+        for (client, video), counts in active.items():
+            summary = ', '.join(f"{n} {event}(s)" for event, n in sorted(counts.items()))
+            logging.info(f"Playback session client {client}, video {video}: "
+                         f"served {summary} in the last {self.interval}s")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
@@ -0,0 +1,149 @@
+# prefetch.py - Playback session tracking and read-ahead for upcoming segments
+import os
+import re
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+SEGMENT_PATTERN = re.compile(r'^(?P<prefix>.*?)(?P<num>\d+)\.ts$')
+HAS_FADVISE = hasattr(os, 'posix_fadvise')
+
+
+def advise_willneed(file_path, offset=0, length=0):
+    """Asks the kernel to start reading a file range into the page cache (no-op where unsupported)."""
+    if not HAS_FADVISE:
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logging.debug(f"Read-ahead hint failed for {file_path}: {e}")
+
+
+class SegmentBuffer:
+    """Small LRU of prefetched segment bytes, bounded by total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_path):
+        """Returns buffered bytes if still current for the file on disk, else None."""
+        with self._lock:
+            item = self._items.get(file_path)
+            if item is None:
+                return None
+            self._items.move_to_end(file_path)
+        mtime, data = item
+        try:
+            if os.path.getmtime(file_path) != mtime:
+                return None
+        except OSError:
+            return None
+        return data
+
+    def put(self, file_path, mtime, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(file_path, None)
+            if old:
+                self.size -= len(old[1])
+            self._items[file_path] = (mtime, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __contains__(self, file_path):
+        with self._lock:
+            return file_path in self._items
+
+
+class Prefetcher:
+    """
+    Tracks which segment each viewer last fetched and warms the next few
+    segments of the same rendition before they are requested: a WILLNEED
+    hint where the OS supports it, plus an optional in-memory buffer.
+    Direct ranged streams get a read-ahead hint past the requested range.
+    """
+
+    def __init__(self, segments_ahead=3, buffer_bytes=64 * 1024 * 1024,
+                 stream_readahead=8 * 1024 * 1024, session_timeout=60, workers=2):
+        self.segments_ahead = segments_ahead
+        self.stream_readahead = stream_readahead
+        self.session_timeout = session_timeout
+        self.buffer = SegmentBuffer(buffer_bytes) if buffer_bytes > 0 else None
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+
+    def segment_served(self, client_ip, videohash, filename, hls_dir):
+        """Records a segment fetch and schedules warming of the segments that follow it."""
+        if os.path.basename(filename) != filename or videohash in ('.', '..'):
+            return  # Only flat files inside a video's own HLS directory are tracked
+        match = SEGMENT_PATTERN.match(filename)
+        if not match or self.segments_ahead <= 0:
+            return
+        prefix, digits = match.group('prefix'), match.group('num')
+        index = int(digits)
+        key = (client_ip, videohash, prefix)
+        now = time.time()
+
+        with self._lock:
+            session = self.sessions.get(key)
+            # Seeking backwards or far ahead restarts the read-ahead window
+            if session is None or not (session['segment'] < index <= session['warmed_to'] + 1):
+                session = {'segment': index, 'warmed_to': index, 'started': now}
+                self.sessions[key] = session
+            session['segment'] = index
+            session['last_seen'] = now
+            first = max(index + 1, session['warmed_to'] + 1)
+            last = index + self.segments_ahead
+            if first <= last:
+                session['warmed_to'] = last
+            self._expire(now)
+
+        for upcoming in range(first, last + 1):
+            name = f"{prefix}{upcoming:0{len(digits)}d}.ts"
+            self._executor.submit(self._warm_segment, os.path.join(hls_dir, name))
+
+    def stream_served(self, file_path, end):
+        """Hints the OS to read ahead past the end of a ranged direct-stream response."""
+        if self.stream_readahead > 0:
+            self._executor.submit(advise_willneed, file_path, end + 1, self.stream_readahead)
+
+    def get_buffered(self, file_path):
+        return self.buffer.get(file_path) if self.buffer else None
+
+    def active_sessions(self):
+        """Returns the viewers seen within the session timeout."""
+        with self._lock:
+            self._expire(time.time())
+            return [{'client': client_ip, 'video': videohash, 'rendition': prefix.rstrip('_') or 'main',
+                     'segment': session['segment'], 'started': session['started'],
+                     'last_seen': session['last_seen']}
+                    for (client_ip, videohash, prefix), session in self.sessions.items()]
+
+    def _warm_segment(self, file_path):
+        try:
+            if not os.path.exists(file_path):
+                return  # Not encoded yet
+            advise_willneed(file_path)
+            if self.buffer is not None and file_path not in self.buffer:
+                mtime = os.path.getmtime(file_path)
+                with open(file_path, 'rb') as f:
+                    self.buffer.put(file_path, mtime, f.read())
+        except Exception as e:
+            logging.debug(f"Prefetch failed for {file_path}: {e}")
+
+    def _expire(self, now):
+        for key in [k for k, s in self.sessions.items() if now - s['last_seen'] > self.session_timeout]:
+            del self.sessions[key]
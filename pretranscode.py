@@ -0,0 +1,244 @@
+# pretranscode.py - Idle-time HLS pre-transcoding of the library
+import os
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import psutil
+
+from config import Config
+from utils import get_file_hash, is_hls_complete
+
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS folder_plays (
+    folder TEXT PRIMARY KEY,
+    plays INTEGER NOT NULL DEFAULT 0,
+    last_played REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pins (
+    path TEXT PRIMARY KEY,
+    created REAL NOT NULL
+);
+"""
+
+
+class WatchStats:
+    """
+    Play counts per library folder and pinned paths, stored next to the job queue.
+    Plays are de-duplicated per viewer and written by a background thread, so
+    recording one never touches the database on the request path.
+    """
+
+    def __init__(self, db_path, session_timeout=1800):
+        self.db_path = str(db_path)
+        self.session_timeout = session_timeout  # Seconds of repeat requests that still count as one play
+        self._recent = {}
+        self._recent_lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._writer = None
+        with self._connect() as conn:
+            conn.executescript(STATS_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:  # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def record_play(self, client, filepath):
+        """
+        Counts a playback start unless this client already requested the video within
+        the session timeout (range requests, playlist fetches, progress reconnects).
+        """
+        now = time.time()
+        key = (client, filepath)
+        with self._recent_lock:
+            last = self._recent.get(key)
+            self._recent[key] = now
+            if last is not None and now - last < self.session_timeout:
+                return False
+            for stale in [k for k, seen in self._recent.items() if now - seen >= self.session_timeout]:
+                del self._recent[stale]
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_plays, name='watch-stats', daemon=True)
+                self._writer.start()
+        self._pending.put((os.path.dirname(filepath), now))
+        return True
+
+    def _write_plays(self):
+        while True:
+            plays = [self._pending.get()]
+            while not self._pending.empty():
+                plays.append(self._pending.get_nowait())
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        "INSERT INTO folder_plays (folder, plays, last_played) VALUES (?, 1, ?) "
+                        "ON CONFLICT(folder) DO UPDATE SET plays = plays + 1, last_played = excluded.last_played",
+                        plays)
+            except Exception as e:
+                logging.warning(f"Failed to record {len(plays)} play(s): {e}")
+
+    def folder_plays(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT folder, plays FROM folder_plays").fetchall())
+
+    def pins(self):
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT path FROM pins ORDER BY created")]
+
+    def add_pin(self, path):
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO pins (path, created) VALUES (?, ?)", (path.strip('/'), time.time()))
+
+    def remove_pin(self, path):
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM pins WHERE path = ?", (path.strip('/'),)).rowcount > 0
+
+
+class PreTranscoder:
+    """
+    Works through the library one video at a time while the server is idle,
+    queueing HLS jobs at PRIORITY_PRETRANSCODE so that workers preempt them as
+    soon as a viewer needs a transcode. Candidates are ordered by the configured
+    policies (pinned, most_watched, newest) and nothing is queued once the HLS
+    cache reaches CACHE_SIZE_BUDGET.
+    """
+
+    def __init__(self, library, job_queue, stats):
+        self.library = library
+        self.job_queue = job_queue
+        self.stats = stats
+        self.current = None   # File hash of the job we queued last
+        self.state = 'starting'
+        self.cache_bytes = 0
+        self._thread = None
+
+    def start(self):
+        psutil.cpu_percent(interval=None)  # Prime the CPU counter
+        self._thread = threading.Thread(target=self._run, name='pretranscode', daemon=True)
+        self._thread.start()
+        logging.info(f"Pre-transcoding enabled (policies: {', '.join(Config.PRETRANSCODE_POLICIES)})")
+
+    def _run(self):
+        while True:
+            time.sleep(Config.PRETRANSCODE_INTERVAL)
+            try:
+                self.state = self.run_cycle()
+            except Exception as e:
+                self.state = f'error: {e}'
+                logging.error(f"Pre-transcoding cycle failed: {e}")
+
+    def run_cycle(self):
+        """Queues the next candidate if the server is idle. Returns a short status."""
+        if self.current:
+            job = self.job_queue.get(self.current)
+            if job and job['status'] in ('queued', 'running'):
+                return f"transcoding {job['path']}"
+            self.current = None
+
+        idle, reason = self.is_idle()
+        if not idle:
+            return reason
+
+        self.cache_bytes = self._cache_size()
+        if Config.CACHE_SIZE_BUDGET and self.cache_bytes >= Config.CACHE_SIZE_BUDGET:
+            return 'cache budget reached'
+
+        entry = self.next_candidate()
+        if entry is None:
+            return 'library fully transcoded'
+
+        file_hash = get_file_hash(entry['path'])
+        self.job_queue.enqueue('hls', file_hash, entry['path'], entry['full_path'],
+                               priority=Config.PRIORITY_PRETRANSCODE)
+        self.current = file_hash
+        logging.info(f"Pre-transcoding queued: {entry['path']}")
+        return f"queued {entry['path']}"
+
+    def is_idle(self):
+        if self.job_queue.has_active(Config.PRIORITY_INTERACTIVE):
+            return False, 'interactive transcode in progress'
+        if self._in_window():
+            return True, 'inside time window'
+        cpu = psutil.cpu_percent(interval=None)
+        if cpu < Config.PRETRANSCODE_CPU_THRESHOLD:
+            return True, 'cpu idle'
+        return False, f'cpu busy ({cpu:.0f}%)'
+
+    def next_candidate(self):
+        """Returns the highest-ranked video without complete HLS output, or None."""
+        pins = self.stats.pins()
+        plays = self.stats.folder_plays()
+
+        def is_pinned(path):
+            return any(path == pin or path.startswith(pin + '/') for pin in pins)
+
+        # Plays are recorded per folder; sum them per top-level folder of each root
+        # ("<root>/<show>"), so watching Show/S1 also ranks Show/S2
+        collection_plays = {}
+        for played, count in plays.items():
+            parts = played.split('/')
+            if len(parts) >= 2:
+                collection = '/'.join(parts[:2])
+                collection_plays[collection] = collection_plays.get(collection, 0) + count
+
+        def folder_plays(path):
+            # Videos directly inside a root belong to no collection and get no boost
+            parts = path.split('/')
+            return collection_plays.get('/'.join(parts[:2]), 0) if len(parts) > 2 else 0
+
+        ranking = {
+            'pinned': lambda entry: 0 if is_pinned(entry['path']) else 1,
+            'most_watched': lambda entry: -folder_plays(entry['path']),
+            'newest': lambda entry: -entry['modified']
+        }
+        keys = [ranking[policy] for policy in Config.PRETRANSCODE_POLICIES if policy in ranking]
+        videos = [entry for entry in self.library.list_files() if entry['video']]
+        videos.sort(key=lambda entry: tuple(key(entry) for key in keys))
+
+        for entry in videos:
+            if is_hls_complete(entry['path']):
+                continue
+            job = self.job_queue.get(get_file_hash(entry['path']))
+            if job and job['status'] == 'failed':
+                continue  # Retried once the failure ages out of the queue
+            return entry
+        return None
+
+    def status(self):
+        return {
+            'enabled': True,
+            'state': self.state,
+            'policies': Config.PRETRANSCODE_POLICIES,
+            'cache_bytes': self.cache_bytes,
+            'cache_budget': Config.CACHE_SIZE_BUDGET,
+            'pins': self.stats.pins()
+        }
+
+    @staticmethod
+    def _in_window():
+        window = Config.PRETRANSCODE_WINDOW
+        if not window:
+            return False
+        start, end = window
+        hour = datetime.now().hour
+        # Windows may wrap around midnight, e.g. (23, 6)
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    @staticmethod
+    def _cache_size():
+        total = 0
+        for dirpath, _, names in os.walk(Config.HLS_DIR):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        return total
@@ -7,12 +7,25 @@ import shutil
 import json
 import time
 from pathlib import Path
+import psutil
 from config import Config
 
 def check_ffmpeg():
     """Checks if FFmpeg is installed and in the system's PATH."""
     return shutil.which("ffmpeg") is not None
 
+def iter_file_range(file_path, start, length, chunk_size=1024 * 1024):
+    """Yields up to length bytes of a file from offset start in chunks (1MB by default)."""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
 def get_file_hash(relative_path):
     """Creates a unique and safe directory name from the file's relative path."""
     return hashlib.md5(relative_path.encode()).hexdigest()
@@ -32,6 +45,147 @@ def get_metadata_path(relative_path):
     file_hash = get_file_hash(relative_path)
     return Config.METADATA_DIR / f"{file_hash}.json"
 
+HLS_VIDEO_PLAYLIST = "video.m3u8"
+HLS_AUDIO_GROUP = "aud"
+
+def _playlist_has_endlist(playlist_path):
+    try:
+        with open(playlist_path, 'r') as f:
+            return "#EXT-X-ENDLIST" in f.read()
+    except OSError:
+        return False
+
+def is_hls_complete(relative_path):
+    """Checks whether a video's HLS output was fully written (ffmpeg appends ENDLIST on success)."""
+    hls_path = get_hls_path(relative_path)
+    if not hls_path.exists():
+        return False
+    # Older outputs used a single muxed media playlist as master.m3u8
+    return _playlist_has_endlist(hls_path) or _playlist_has_endlist(hls_path.parent / HLS_VIDEO_PLAYLIST)
+
+def remove_hls_output(hls_dir):
+    """Deletes playlists and segments (including unfinished ones) from an HLS output directory."""
+    for pattern in ("*.ts", "*.tmp", "*.m3u8"):
+        for file in Path(hls_dir).glob(pattern):
+            file.unlink(missing_ok=True)
+
+def count_hls_segments(hls_dir):
+    """Counts the video segments written so far into an HLS output directory."""
+    return sum(1 for pattern in ("video_*.ts", "segment*.ts") for _ in Path(hls_dir).glob(pattern))
+
+def _m3u8_quote(value):
+    # Quoted-string attributes may not contain double quotes or line breaks
+    return '"' + str(value).replace('"', "'").replace('\r', ' ').replace('\n', ' ') + '"'
+
+def write_hls_master(hls_dir, metadata, audio_tracks):
+    """
+    Writes master.m3u8 pointing at the video rendition and, when audio_tracks
+    were encoded as separate renditions, one EXT-X-MEDIA entry per track so
+    players download only the selected language.
+    """
+    video_info = (metadata or {}).get("video_info") or {}
+    try:
+        video_bitrate = int(video_info.get("bit_rate") or (metadata or {}).get("format", {}).get("bit_rate"))
+    except (TypeError, ValueError):
+        video_bitrate = 5000000  # Unknown source bitrate; a rough HD estimate keeps players happy
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    names = set()
+    for i, track in enumerate(audio_tracks):
+        name = track.get("title") or f"Audio Track {i + 1}"
+        if name in names:
+            name = f"{name} ({i + 1})"  # NAME must be unique within the group
+        names.add(name)
+        attributes = ["TYPE=AUDIO", f"GROUP-ID={_m3u8_quote(HLS_AUDIO_GROUP)}", f"NAME={_m3u8_quote(name)}"]
+        language = track.get("language")
+        if language and language != "unknown":
+            attributes.append(f"LANGUAGE={_m3u8_quote(language)}")
+        attributes += [f"DEFAULT={'YES' if i == 0 else 'NO'}", "AUTOSELECT=YES",
+                       f"CHANNELS={_m3u8_quote(track.get('channels') or 2)}",
+                       f"URI={_m3u8_quote(f'audio_{i}.m3u8')}"]
+        lines.append("#EXT-X-MEDIA:" + ",".join(attributes))
+
+    stream_info = [f"BANDWIDTH={video_bitrate + Config.HLS_AUDIO_BITRATE}"]
+    if video_info.get("width") and video_info.get("height"):
+        stream_info.append(f"RESOLUTION={video_info['width']}x{video_info['height']}")
+    if audio_tracks:
+        stream_info.append(f"AUDIO={_m3u8_quote(HLS_AUDIO_GROUP)}")
+    lines += ["#EXT-X-STREAM-INF:" + ",".join(stream_info), HLS_VIDEO_PLAYLIST]
+
+    # Replace atomically so a player never reads a half-written master
+    master_path = Path(hls_dir) / "master.m3u8"
+    tmp_path = master_path.with_suffix(".m3u8.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, master_path)
+
+class FFmpegProgress:
+    """
+    Parses the key=value blocks ffmpeg writes with `-progress pipe:1`.
+    Each block ends with a `progress=continue|end` line, at which point a
+    state snapshot is available.
+    """
+
+    def __init__(self, duration=None):
+        self.duration = duration
+        self._fields = {}
+
+    def feed(self, line):
+        """Consumes one output line. Returns a state dict when a block completes, else None."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        self._fields[key] = value.strip()
+        if key != "progress":
+            return None
+        return self.state()
+
+    def state(self):
+        out_time = self._parse_out_time()
+        speed = self._parse_float(self._fields.get("speed", "").rstrip("x"))
+        fps = self._parse_float(self._fields.get("fps"))
+
+        percent = 0.0
+        eta = None
+        if self.duration and out_time is not None:
+            percent = min(100.0, max(0.0, out_time / self.duration * 100))
+            if speed > 0:
+                eta = max(0.0, (self.duration - out_time) / speed)
+
+        return {
+            "percent": round(percent, 1),
+            "fps": fps,
+            "speed": speed,
+            "eta": round(eta) if eta is not None else None,
+            "out_time": out_time
+        }
+
+    def _parse_out_time(self):
+        # out_time_ms is (despite its name) reported in microseconds, like out_time_us
+        for key in ("out_time_us", "out_time_ms"):
+            value = self._fields.get(key)
+            if value and value.lstrip("-").isdigit():
+                return max(0, int(value)) / 1_000_000
+        return None
+
+    @staticmethod
+    def _parse_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+def _get_media_duration(metadata):
+    """Returns the duration in seconds from probed metadata, or None if unknown."""
+    if not metadata:
+        return None
+    for source in (metadata.get("video_info") or {}, metadata.get("format") or {}):
+        try:
+            return float(source["duration"])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
 def extract_video_metadata(video_path):
     """Extract metadata about audio and subtitle tracks from a video file."""
     if not check_ffmpeg():
@@ -109,18 +263,30 @@ def extract_video_metadata(video_path):
         logging.error(f"Unexpected error extracting metadata: {e}")
         return None
 
-def generate_thumbnail_and_hls(video_path, base_dir, thumbnail_only=False):
+def generate_thumbnail_and_hls(video_path, relative_path, thumbnail_only=False, on_progress=None,
+                               should_pause=None, while_paused=None):
     """
     Generates thumbnail and optionally HLS playlist for a video.
     Preserves all audio and subtitle tracks from MKV files.
+    relative_path is the library-namespaced path that keys the video's cache entries.
+    If given, on_progress is called with a state dict (status, percent, fps,
+    speed, eta, segments) while the HLS encode runs and once it finishes.
+    If should_pause returns True during the encode, ffmpeg is suspended while
+    while_paused runs and resumed once it returns, keeping the output so far.
     """
+    def report(**state):
+        if on_progress:
+            try:
+                on_progress(state)
+            except Exception as e:
+                logging.warning(f"Progress callback failed: {e}")
+
     if not check_ffmpeg():
         logging.error("FFmpeg not found. Cannot process video files.")
+        report(status="failed", error="FFmpeg not found")
         return
 
     try:
-        relative_path = os.path.relpath(video_path, base_dir)
-        
         # --- Extract and Save Metadata ---
         metadata_path = get_metadata_path(relative_path)
         metadata = None
@@ -182,9 +348,12 @@ def generate_thumbnail_and_hls(video_path, base_dir, thumbnail_only=False):
         hls_master_path = get_hls_path(relative_path)
         hls_dir = hls_master_path.parent
         
-        if not hls_master_path.exists():
+        if not is_hls_complete(relative_path):
             logging.info(f"Generating HLS for {relative_path}...")
             hls_dir.mkdir(parents=True, exist_ok=True)
+            # Clear leftovers of an interrupted run so segment counts start from zero
+            remove_hls_output(hls_dir)
+            report(status="running", percent=0.0, segments=0)
             
             # Load metadata if not already loaded
             if not metadata and metadata_path.exists():
@@ -240,17 +409,22 @@ def generate_thumbnail_and_hls(video_path, base_dir, thumbnail_only=False):
             # Start building the FFmpeg command
             cmd_hls = [
                 "ffmpeg", "-hide_banner",
+                "-loglevel", "error",
+                "-nostats",
+                "-progress", "pipe:1",               # Machine-readable progress on stdout
                 "-err_detect", "ignore_err",
                 "-i", video_path,
                 # Map all streams
                 "-map", "0:v:0?",  # First video stream
             ]
             
-            # Add audio stream mapping based on metadata
-            has_audio_tracks = False
-            if metadata and metadata.get("audio_tracks"):
-                has_audio_tracks = True
-                for track in metadata["audio_tracks"]:
+            # Each probed audio track becomes its own rendition, so viewers only
+            # download the language they listen to. Without probed tracks (or a
+            # video stream to pair them with) audio stays muxed into the video.
+            audio_tracks = []
+            if metadata and metadata.get("audio_tracks") and metadata.get("video_info"):
+                audio_tracks = metadata["audio_tracks"]
+                for track in audio_tracks:
                     cmd_hls.extend(["-map", f"0:{track['index']}"])
             else:
                 # Fallback: map all audio streams
@@ -282,19 +456,11 @@ def generate_thumbnail_and_hls(video_path, base_dir, thumbnail_only=False):
             # Add video codec settings
             cmd_hls.extend(video_codec)
             
-            # Add audio codec settings - per-stream encoding
-            if has_audio_tracks and metadata:
-                for i, _ in enumerate(metadata["audio_tracks"]):
-                    cmd_hls.extend([
-                        f"-c:a:{i}", "aac",
-                        f"-b:a:{i}", "128k"
-                    ])
-            else:
-                # Default audio encoding
-                cmd_hls.extend([
-                    "-c:a", "aac",
-                    "-b:a", "128k"
-                ])
+            # Add audio codec settings (applies to every mapped audio stream)
+            cmd_hls.extend([
+                "-c:a", "aac",
+                "-b:a", str(Config.HLS_AUDIO_BITRATE)
+            ])
             
             # Create an HLS manifest file to describe all tracks
             variant_manifest = {
@@ -312,6 +478,20 @@ def generate_thumbnail_and_hls(video_path, base_dir, thumbnail_only=False):
             with open(variant_manifest_path, 'w') as f:
                 json.dump(variant_manifest, f, indent=2)
             
+            # One playlist and segment series per rendition: video.m3u8 + video_NNN.ts,
+            # audio_N.m3u8 + audio_N_NNN.ts
+            if audio_tracks:
+                stream_map = [f"v:0,agroup:{HLS_AUDIO_GROUP},name:video"]
+                stream_map += [f"a:{i},agroup:{HLS_AUDIO_GROUP},name:audio_{i}" for i in range(len(audio_tracks))]
+                cmd_hls.extend(["-var_stream_map", " ".join(stream_map)])
+                segment_pattern, playlist_pattern = "%v_%03d.ts", "%v.m3u8"
+            else:
+                segment_pattern, playlist_pattern = "video_%03d.ts", HLS_VIDEO_PLAYLIST
+
+            # The master only references rendition playlists, so it can be written
+            # before encoding and players can start as soon as segments appear
+            write_hls_master(hls_dir, metadata, audio_tracks)
+
             # Add optimized HLS settings
             cmd_hls.extend([
                 # Create an efficient HLS playlist
@@ -319,38 +499,61 @@ def generate_thumbnail_and_hls(video_path, base_dir, thumbnail_only=False):
                 "-hls_list_size", "0",               # Keep all segments
                 "-hls_segment_type", "mpegts",       # Most compatible segment type
                 "-hls_playlist_type", "event",       # Better for VOD content
-                "-hls_segment_filename", str(hls_dir / "segment%03d.ts"),
-                "-hls_flags", "independent_segments+discont_start",
+                "-hls_segment_filename", str(hls_dir / segment_pattern),
+                "-hls_flags", "independent_segments+discont_start+temp_file",  # Segments appear only once complete
                 "-f", "hls",
                 # Force overwrite
                 "-y", 
-                str(hls_master_path)
+                str(hls_dir / playlist_pattern)
             ])
             
             try:
-                # Use Popen to capture output in real-time
+                # Use Popen to capture output in real-time; errors are merged into
+                # the progress stream so a single reader drains both
                 process = subprocess.Popen(
                     cmd_hls, 
                     stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE, 
+                    stderr=subprocess.STDOUT, 
                     text=True,
                     bufsize=1,  # Line buffered
                     universal_newlines=True
                 )
                 
                 # Monitor progress without blocking
+                progress = FFmpegProgress(_get_media_duration(metadata))
                 start_time = time.time()
                 last_log_time = start_time
+                error_lines = []
                 
-                for line in process.stderr:
-                    # Log progress every 10 seconds to avoid log spam
+                for line in process.stdout:
                     current_time = time.time()
-                    if current_time - last_log_time > 10:
-                        logging.info(f"HLS generation for {relative_path} in progress: {line.strip()}")
-                        last_log_time = current_time
+                    state = progress.feed(line)
+                    if state is None:
+                        if line.strip() and "=" not in line:
+                            error_lines = (error_lines + [line.strip()])[-20:]
+                    else:
+                        report(status="running", segments=count_hls_segments(hls_dir), **state)
+                        # Log progress every 10 seconds to avoid log spam
+                        if current_time - last_log_time > 10:
+                            logging.info(f"HLS generation for {relative_path} in progress: "
+                                         f"{state['percent']}% at {state['speed']}x")
+                            last_log_time = current_time
+                        
+                        if should_pause and should_pause():
+                            paused_at = time.time()
+                            encoder = psutil.Process(process.pid)
+                            encoder.suspend()
+                            logging.info(f"HLS generation for {relative_path} paused")
+                            try:
+                                while_paused()
+                            finally:
+                                encoder.resume()
+                            # Time spent paused does not count towards the timeout
+                            start_time += time.time() - paused_at
+                            logging.info(f"HLS generation for {relative_path} resumed")
                     
                     # Implement timeout
-                    if current_time - start_time > 1800:  # 30 minute timeout
+                    if current_time - start_time > Config.HLS_TIMEOUT:
                         process.terminate()
                         logging.error(f"HLS generation timed out for {relative_path}")
                         break
@@ -359,6 +562,7 @@ def generate_thumbnail_and_hls(video_path, base_dir, thumbnail_only=False):
                 process.wait()
                 if process.returncode == 0:
                     logging.info(f"HLS playlist created: {hls_master_path}")
+                    report(status="done", percent=100.0, eta=0, segments=count_hls_segments(hls_dir))
                     
                     # Generate thumbnail previews for seeking (10 thumbnails throughout the video)
                     if metadata and metadata.get("video_info") and metadata["video_info"].get("duration"):
@@ -386,23 +590,27 @@ def generate_thumbnail_and_hls(video_path, base_dir, thumbnail_only=False):
                             except Exception as e:
                                 logging.warning(f"Failed to generate preview thumbnail {i}: {e}")
                 else:
-                    logging.error(f"HLS generation failed with code {process.returncode}")
+                    logging.error(f"HLS generation failed with code {process.returncode}: "
+                                  f"{' | '.join(error_lines[-3:])}")
+                    report(status="failed", error=f"ffmpeg exited with code {process.returncode}")
                     
             except Exception as e:
                 logging.error(f"Error during HLS generation: {e}")
+                report(status="failed", error=str(e))
                 # Cleanup partial files
                 if hls_dir.exists():
-                    for file in hls_dir.glob("*.ts"):
-                        file.unlink(missing_ok=True)
-                    for file in hls_dir.glob("*.m3u8"):
-                        file.unlink(missing_ok=True)
+                    remove_hls_output(hls_dir)
                 return
         else:
             logging.info(f"HLS already exists for {relative_path}.")
+            report(status="done", percent=100.0, eta=0, segments=count_hls_segments(hls_dir))
 
     except subprocess.CalledProcessError as e:
         logging.error(f"FFmpeg failed for {video_path}. Error: {e.stderr}")
+        report(status="failed", error="FFmpeg failed")
     except subprocess.TimeoutExpired:
         logging.error(f"FFmpeg timed out while processing {video_path}. It may be corrupt or too large.")
+        report(status="failed", error="FFmpeg timed out")
     except Exception as e:
-        logging.error(f"An unexpected error occurred while processing {video_path}: {e}")
\ No newline at end of file
+        logging.error(f"An unexpected error occurred while processing {video_path}: {e}")
+        report(status="failed", error=str(e))
\ No newline at end of file
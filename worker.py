@@ -0,0 +1,166 @@
+# worker.py - Standalone transcode worker
+"""
+Consumes thumbnail and HLS jobs from the durable job queue.
+
+Run one or more of these next to (or instead of) the web server's embedded
+workers, on this machine or any other that mounts the same cache directory:
+
+    python -m worker --concurrency 2
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+
+from config import Config
+from jobs import JobQueue, default_worker_id
+from logconfig import setup_logging
+from utils import generate_thumbnail_and_hls
+
+
+class TranscodeWorker:
+    """Claims jobs from the queue one at a time and runs them until stopped."""
+
+    def __init__(self, queue, stop_event, worker_id=None):
+        self.queue = queue
+        self.stop_event = stop_event
+        self.worker_id = worker_id
+        self.last_report = 0
+
+    def run_forever(self):
+        self.worker_id = self.worker_id or default_worker_id()
+        logging.info(f"Transcode worker {self.worker_id} started")
+        while not self.stop_event.is_set():
+            try:
+                self.queue.recover_stale()
+                job = self.queue.claim(self.worker_id)
+            except Exception as e:
+                logging.error(f"Worker {self.worker_id} could not read the job queue: {e}")
+                job = None
+
+            if job is None:
+                self.stop_event.wait(Config.WORKER_POLL_INTERVAL)
+                continue
+
+            self.run_claimed(job)
+        logging.info(f"Transcode worker {self.worker_id} stopped")
+
+    def run_claimed(self, job):
+        """Runs a job without letting queue errors end the worker; unrecorded jobs are requeued once stale."""
+        try:
+            self.run_job(job)
+        except Exception as e:
+            logging.error(f"Worker {self.worker_id} could not finish {job['kind']} job for {job['path']}: {e}")
+
+    def run_job(self, job):
+        """Runs a claimed job and records its outcome in the queue."""
+        logging.info(f"Worker {self.worker_id} processing {job['kind']} job for {job['path']}")
+        outcome = {}
+
+        def on_progress(state):
+            outcome.update(state)
+            # Throttle writes; every write also serves as the job's heartbeat
+            now = time.time()
+            if state.get('status') == 'running' and now - self.last_report < Config.PROGRESS_INTERVAL:
+                return
+            self.last_report = now
+            self.queue.update_progress(job['id'], state)
+
+        # Background work (pre-transcoding) is suspended, not discarded, while a viewer
+        # is waiting on or watching a transcode; this worker serves that work meanwhile
+        preemptible = job['priority'] < Config.PRIORITY_BACKGROUND
+        last_check = [0]
+
+        def should_pause():
+            now = time.time()
+            if not preemptible or now - last_check[0] < Config.PROGRESS_INTERVAL:
+                return False
+            last_check[0] = now
+            try:
+                return self.queue.should_yield(job['id'], Config.PRIORITY_INTERACTIVE)
+            except Exception as e:
+                logging.warning(f"Worker {self.worker_id} could not check for interactive jobs: {e}")
+                return False
+
+        def while_paused():
+            logging.info(f"Worker {self.worker_id} paused {job['path']} for interactive work")
+            while not self.stop_event.is_set():
+                try:
+                    interactive = self.queue.claim(self.worker_id, min_priority=Config.PRIORITY_INTERACTIVE)
+                    if interactive is None and not self.queue.should_yield(job['id'], Config.PRIORITY_INTERACTIVE):
+                        break
+                except Exception as e:
+                    logging.error(f"Worker {self.worker_id} could not read the job queue: {e}")
+                    interactive = None
+                if interactive:
+                    self.run_claimed(interactive)
+                else:
+                    self.stop_event.wait(Config.WORKER_POLL_INTERVAL)  # Running on another worker
+
+        # Keep the job alive through steps that report no progress (subtitle extraction, previews)
+        finished = threading.Event()
+
+        def heartbeat():
+            while not finished.wait(Config.WORKER_HEARTBEAT_INTERVAL):
+                try:
+                    self.queue.heartbeat(job['id'])
+                except Exception as e:
+                    logging.warning(f"Heartbeat failed for job {job['id']}: {e}")
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            generate_thumbnail_and_hls(job['video_path'], job['path'],
+                                       thumbnail_only=job['kind'] == 'thumbnail', on_progress=on_progress,
+                                       should_pause=should_pause, while_paused=while_paused)
+        except Exception as e:
+            outcome.update(status='failed', error=str(e))
+        finally:
+            finished.set()
+
+        if outcome.get('status') == 'failed':
+            self.queue.fail(job['id'], outcome.get('error', 'Unknown error'))
+        else:
+            self.queue.complete(job['id'])
+
+
+def start_workers(queue, count, stop_event):
+    """Starts worker threads consuming the queue. Returns the started threads."""
+    threads = []
+    for i in range(count):
+        worker = TranscodeWorker(queue, stop_event)
+        thread = threading.Thread(target=worker.run_forever, name=f"transcode-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FilesFlix transcode worker")
+    parser.add_argument('--concurrency', type=int, default=1, help="number of jobs to run in parallel")
+    parser.add_argument('--db', default=str(Config.JOB_DB_PATH), help="path to the shared job queue database")
+    args = parser.parse_args(argv)
+
+    Config.init_app(None)
+    setup_logging('worker.log', fmt='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
+
+    queue = JobQueue(args.db, stale_timeout=Config.JOB_STALE_TIMEOUT, retention=Config.JOB_RETENTION,
+                     shared=Config.JOB_DB_SHARED)
+    stop_event = threading.Event()
+
+    def shutdown(signum, frame):
+        logging.info("Shutdown requested; finishing running jobs...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    threads = start_workers(queue, args.concurrency, stop_event)
+    while any(thread.is_alive() for thread in threads):
+        queue.prune()
+        for thread in threads:
+            thread.join(timeout=60 / len(threads))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# zipstream.py - On-the-fly zip archives for multi-file downloads
+import struct
+import time
+import zlib
+
+from utils import iter_file_range
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_MAX_ENTRIES = 0xFFFF
+VERSION_ZIP64 = 45
+VERSION_DEFAULT = 20
+FLAGS = 0x0808  # Bit 3: CRC and sizes follow in a data descriptor; bit 11: UTF-8 names
+
+
+class ZipEntry:
+    def __init__(self, arcname, full_path, size, mtime):
+        self.arcname = arcname.encode('utf-8')
+        self.full_path = full_path
+        self.size = size
+        self.dos_time, self.dos_date = _dos_datetime(mtime)
+        self.zip64 = size >= ZIP32_LIMIT
+        self.offset = 0
+        self.crc = 0
+
+    @property
+    def local_header_size(self):
+        return 30 + len(self.arcname) + (20 if self.zip64 else 0)
+
+    @property
+    def descriptor_size(self):
+        return 24 if self.zip64 else 16
+
+    def central_extra(self):
+        values = []
+        if self.zip64:
+            values += [self.size, self.size]
+        if self.offset >= ZIP32_LIMIT:
+            values.append(self.offset)
+        if not values:
+            return b''
+        return struct.pack(f'<HH{len(values)}Q', 0x0001, 8 * len(values), *values)
+
+
+class ZipStream:
+    """
+    Store-mode (uncompressed) zip archive generated while it is sent.
+    Memory stays bounded by the read chunk size, nothing is written to disk,
+    and because stored entries keep their size the archive length is known
+    up front. ZIP64 records are used only where sizes or offsets need them.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            offset += entry.local_header_size + entry.size + entry.descriptor_size
+        self.cd_offset = offset
+        self.cd_size = sum(46 + len(e.arcname) + len(e.central_extra()) for e in entries)
+        self.zip64_end = (len(entries) >= ZIP32_MAX_ENTRIES or self.cd_offset >= ZIP32_LIMIT
+                          or self.cd_size >= ZIP32_LIMIT)
+
+    def __len__(self):
+        return self.cd_offset + self.cd_size + (56 + 20 if self.zip64_end else 0) + 22
+
+    def __iter__(self):
+        for entry in self.entries:
+            yield self._local_header(entry)
+            crc = 0
+            written = 0
+            for chunk in iter_file_range(entry.full_path, 0, entry.size):
+                crc = zlib.crc32(chunk, crc)
+                written += len(chunk)
+                yield chunk
+            if written != entry.size:
+                # The precomputed Content-Length can no longer be honoured
+                raise IOError(f"{entry.full_path} changed size while being archived")
+            entry.crc = crc
+            yield self._data_descriptor(entry)
+
+        for entry in self.entries:
+            yield self._central_header(entry)
+        yield self._end_records()
+
+    def _local_header(self, entry):
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if entry.zip64 else b''
+        size_field = ZIP32_LIMIT if entry.zip64 else 0
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50,
+            VERSION_ZIP64 if entry.zip64 else VERSION_DEFAULT, FLAGS, 0,
+            entry.dos_time, entry.dos_date, 0, size_field, size_field,
+            len(entry.arcname), len(extra)) + entry.arcname + extra
+
+    def _data_descriptor(self, entry):
+        if entry.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, entry.crc, entry.size, entry.size)
+        return struct.pack('<IIII', 0x08074b50, entry.crc, entry.size, entry.size)
+
+    def _central_header(self, entry):
+        extra = entry.central_extra()
+        version = VERSION_ZIP64 if extra else VERSION_DEFAULT
+        size_field = ZIP32_LIMIT if entry.zip64 else entry.size
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, version, version, FLAGS, 0,
+            entry.dos_time, entry.dos_date, entry.crc, size_field, size_field,
+            len(entry.arcname), len(extra), 0, 0, 0, 0,
+            min(entry.offset, ZIP32_LIMIT)) + entry.arcname + extra
+
+    def _end_records(self):
+        count = len(self.entries)
+        records = b''
+        if self.zip64_end:
+            zip64_end_offset = self.cd_offset + self.cd_size
+            records += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, VERSION_ZIP64, VERSION_ZIP64,
+                                   0, 0, count, count, self.cd_size, self.cd_offset)
+            records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+        records += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0,
+                               min(count, ZIP32_MAX_ENTRIES), min(count, ZIP32_MAX_ENTRIES),
+                               min(self.cd_size, ZIP32_LIMIT), min(self.cd_offset, ZIP32_LIMIT), 0)
+        return records
+
+
+def _dos_datetime(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)